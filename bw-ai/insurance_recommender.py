@@ -1,52 +1,206 @@
-import json
 import os
-import uuid
+import queue
+import sys
+import threading
+import time
 import re
+from concurrent.futures import Future
+from contextlib import nullcontext
+from uuid import uuid4
+from functools import lru_cache
+
+import orjson
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+# torch/faiss import 전에 설정해야 uvicorn 워커 간 스레드 과점유를 막음
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+faiss_path = os.path.join(CURRENT_DIR, "..", "faiss_index")
+
 # FAISS 기반 RAG + LLM 관련 임포트
 try:
+    import faiss
+    import numpy as np
     from langchain_community.vectorstores import FAISS
-    from langchain_huggingface import HuggingFaceEmbeddings
     from langchain_core.documents import Document
 
-    # rag_pipeline import (LLM + 프롬프트)
-    from rag_pipeline import ask_question
-
-    # 임베딩 모델 초기화
-    embeddings = HuggingFaceEmbeddings(
-        model_name="jhgan/ko-sroberta-multitask",
-        model_kwargs={"device": "cpu"},
-        encode_kwargs={"normalize_embeddings": True},
-    )
-
-    # FAISS 벡터스토어 절대 경로 설정
-    CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-    faiss_path = os.path.join(CURRENT_DIR, "..", "faiss_index")
-
-    # FAISS 벡터스토어 로드
-    if os.path.exists(os.path.join(faiss_path, "index.faiss")):
-        vectorstore = FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
-        print(f"✅ 기존 FAISS 벡터스토어 로드됨: {vectorstore.index.ntotal}개 문서")
-    else:
-        vectorstore = None
-        print("🆕 FAISS 벡터스토어 생성 예정")
+    # rag_pipeline import (LLM + 프롬프트 + 임베딩 싱글톤)
+    from rag_pipeline import ask_question, get_embeddings, EMBEDDING_MODEL_NAME
 
     RAG_AVAILABLE = True
     LLM_AVAILABLE = True
 
 except Exception as e:
     print(f"❌ RAG 시스템 초기화 실패: {e}")
-    vectorstore = None
-    embeddings = None
     RAG_AVAILABLE = False
     LLM_AVAILABLE = False
-    CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# FAISS 벡터스토어 lazy 싱글톤 (워커마다 import 시점에 로드하지 않음)
+_vectorstore = None
+_vectorstore_loaded = False
+_vectorstore_lock = threading.Lock()
+
+
+def get_vectorstore():
+    """첫 추천 요청 시점에 한 번만 FAISS 벡터스토어를 로드.
+
+    로드는 수 초가 걸리므로 double-checked lock으로 감싸 동시 cold start
+    스레드들이 반쯤 초기화된 상태(None)를 보지 않고 완료까지 대기하게 한다.
+    """
+    global _vectorstore, _vectorstore_loaded
+    if not _vectorstore_loaded and RAG_AVAILABLE:
+        with _vectorstore_lock:
+            if _vectorstore_loaded:
+                return _vectorstore
+            if os.path.exists(os.path.join(faiss_path, "index.faiss")):
+                try:
+                    _vectorstore = FAISS.load_local(
+                        faiss_path, get_embeddings(), allow_dangerous_deserialization=True
+                    )
+                    # 인덱스 파일을 mmap 읽기 전용으로 다시 열어 워커 간 페이지 공유
+                    try:
+                        _vectorstore.index = faiss.read_index(
+                            os.path.join(faiss_path, "index.faiss"),
+                            faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+                        )
+                    except Exception:
+                        pass  # mmap 미지원 인덱스 타입이면 일반 로드 유지
+                    print(f"✅ 기존 FAISS 벡터스토어 로드됨: {_vectorstore.index.ntotal}개 문서")
+                except Exception as e:
+                    print(f"❌ FAISS 벡터스토어 로드 실패: {e}")
+            else:
+                print("🆕 FAISS 벡터스토어 생성 예정")
+            # 로드 시도가 끝난 뒤에만 완료 플래그 세팅
+            _vectorstore_loaded = True
+    return _vectorstore
+
+
+# 인덱스 빌드 직렬화용 파일 락 (미설치 시 단일 프로세스 가정 no-op)
+try:
+    from filelock import FileLock
+except Exception:
+    FileLock = None
+
+
+def _build_lock():
+    if FileLock is not None:
+        return FileLock(faiss_path + ".lock")
+    return nullcontext()
+
+
+# 질의 임베딩 LRU 캐시
+# (주수/다태아/위험요인) 조합으로 만들어지는 질의는 사용자 간 중복이 많아
+# 캐시 적중 시 인코더 forward 비용이 통째로 사라짐.
+# 모델명을 키에 포함해 임베딩 모델 교체 시 자동 무효화.
+@lru_cache(maxsize=1024)
+def _embed_query_cached(model_name: str, query: str):
+    return np.asarray(get_embeddings().embed_query(query), dtype=np.float32)
+
+
+def embedding_cache_info() -> Dict[str, int]:
+    """/metrics 노출용 질의 임베딩 캐시 적중률."""
+    info = _embed_query_cached.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "currsize": info.currsize,
+        "maxsize": info.maxsize,
+    }
+
+
+class SemanticLLMCache:
+    """LLM 응답 시맨틱 캐시.
+
+    프로필은 (주수 버킷, 위험요인, 다태아) 조합으로 뭉치므로
+    정규화 키로 exact 매칭을 먼저 시도하고, miss 시 질의 임베딩의
+    코사인 유사도(IndexFlatIP, 임베딩은 이미 정규화됨)가 임계값을
+    넘는 기존 항목의 응답을 재사용한다. 항목은 TTL로 만료.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, maxsize: int = 256):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: List[Dict[str, Any]] = []  # {key, emb, answer, ts}
+        self._exact: Dict[Any, int] = {}
+        self._index = None  # faiss.IndexFlatIP
+        # _rebuild가 세 구조를 비원자적으로 갈아끼우므로 get/put을 직렬화
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(analysis: Dict[str, Any]):
+        return (
+            int(analysis.get("gestational_week", 0)) // 4,
+            tuple(sorted(analysis.get("risk_factors", []))),
+            bool(analysis.get("is_multiple_pregnancy")),
+        )
+
+    def _rebuild(self, entries: List[Dict[str, Any]]):
+        self._entries = entries[-self.maxsize:]
+        self._exact = {e["key"]: i for i, e in enumerate(self._entries)}
+        if self._entries:
+            embs = np.stack([e["emb"] for e in self._entries])
+            self._index = faiss.IndexFlatIP(embs.shape[1])
+            self._index.add(embs)
+        else:
+            self._index = None
+
+    def _purge_expired(self):
+        now = time.time()
+        live = [e for e in self._entries if now - e["ts"] <= self.ttl]
+        if len(live) != len(self._entries):
+            self._rebuild(live)
+
+    def get(self, analysis: Dict[str, Any], query: str) -> Optional[str]:
+        try:
+            with self._lock:
+                self._purge_expired()
+                if not self._entries:
+                    return None
+                # 1차: 정규화 키 exact 매칭
+                hit = self._exact.get(self._make_key(analysis))
+                if hit is not None:
+                    return self._entries[hit]["answer"]
+            # 임베딩(인코더 forward)은 락 밖에서 수행
+            vec = _embed_query_cached(EMBEDDING_MODEL_NAME, query)
+            with self._lock:
+                # 2차: 임베딩 코사인 유사도 매칭
+                if self._index is None or not self._entries:
+                    return None
+                scores, ids = self._index.search(vec.reshape(1, -1), 1)
+                if ids[0][0] != -1 and scores[0][0] > self.threshold:
+                    return self._entries[int(ids[0][0])]["answer"]
+            return None
+        except Exception as e:
+            print(f"⚠️ LLM 캐시 조회 실패: {e}")
+            return None
+
+    def put(self, analysis: Dict[str, Any], query: str, answer: str):
+        try:
+            vec = _embed_query_cached(EMBEDDING_MODEL_NAME, query)
+            entry = {
+                "key": self._make_key(analysis),
+                "emb": vec,
+                "answer": answer,
+                "ts": time.time(),
+            }
+            with self._lock:
+                self._rebuild(self._entries + [entry])
+        except Exception as e:
+            print(f"⚠️ LLM 캐시 저장 실패: {e}")
+
+
+_llm_cache = SemanticLLMCache()
 
 # 보험료 및 가입금액 테이블 로드
 PRICE_MAP = {}
 SUM_INSURED_MAP = {}
+# (보험사, 상품명) → (가입금액, 월 보험료) 병합 테이블 — 추천 1건당 dict 조회 1회
+COMBINED_MAP = {}
+DEFAULT_PRICE_ENTRY = (10000000, 30000)
 PRICE_FILE = os.path.join(CURRENT_DIR, "prices.json")
 SUM_INSURED_FILE = os.path.join(CURRENT_DIR, "sum_insured.json")
 
@@ -59,16 +213,61 @@ def _load_data_maps():
     ]:
         if os.path.exists(file_path):
             try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    target_map.update(json.load(f))
+                with open(file_path, "rb") as f:
+                    target_map.update(orjson.loads(f.read()))
                 print(f"✅ {name} 테이블 로드 완료")
             except Exception as e:
                 print(f"❌ {name} 로드 실패: {e}")
 
+    # 두 2단계 테이블을 (보험사, 상품명) 키의 단일 dict로 병합.
+    # sys.intern으로 키 문자열을 인터닝해 튜플 해시 비용도 재사용.
+    COMBINED_MAP.clear()
+    for comp, sub in SUM_INSURED_MAP.items():
+        comp_i = sys.intern(comp)
+        price_sub = PRICE_MAP.get(comp, {})
+        for prod, si in sub.items():
+            COMBINED_MAP[(comp_i, sys.intern(prod))] = (si, price_sub.get(prod, DEFAULT_PRICE_ENTRY[1]))
+    for comp, sub in PRICE_MAP.items():
+        comp_i = sys.intern(comp)
+        for prod, pr in sub.items():
+            key = (comp_i, sys.intern(prod))
+            if key not in COMBINED_MAP:
+                COMBINED_MAP[key] = (DEFAULT_PRICE_ENTRY[0], pr)
+
 
 _load_data_maps()
 
 
+# 컨텍스트 블록 템플릿 (호출마다 f-string 포맷 경로를 타지 않도록 1회 정의)
+_CONTEXT_TPL = "[문서 {i}] 상품:{p}, 페이지:{pg}\n내용:{c}"
+
+# LLM 응답 파싱용 사전 컴파일 패턴/테이블 (호출마다 재컴파일·재할당 방지)
+_JSON_BLOCK = re.compile(r"\{.*\}", re.DOTALL)
+# 한국어 인용부호류 → ASCII 작은따옴표 일괄 치환
+_QUOTE_TABLE = dict.fromkeys(map(ord, "「」“”"), ord("'"))
+# 파이썬 리터럴 → JSON 리터럴
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL_RE = re.compile(r"\b(?:True|False|None)\b")
+
+
+# 임신 합병증 코드 → 위험요인 명칭 (요청마다 분기하지 않도록 테이블화)
+COMPLICATION_MAP = {
+    "PREECLAMPSIA": "임신중독증",
+    "PRETERM_RISK": "조산위험",
+}
+
+# (주수, 다태아) → 검색 쿼리 접두부 사전 계산 테이블.
+# 주수는 0-42로 유계, 다태아는 불리언이라 86개 조합을 모듈 로드 시 전개.
+# 쿼리 문자열 종류가 줄어 임베딩 LRU 캐시 적중률도 올라간다.
+_BASE_QUERIES = {
+    (w, m): "임신 보험 태아 보장"
+    + (f" {w}주" if w > 0 else "")
+    + (" 다태아 쌍둥이" if m else "")
+    for w in range(43)
+    for m in (False, True)
+}
+
+
 # ---- 보험사명 추출(오답 방지용) ----
 INSURER_NAMES = [
     "삼성화재",
@@ -83,9 +282,40 @@ INSURER_NAMES = [
 ]
 
 
+# 보험상품명(플랜명)에서 흔히 보이는 키워드
+PLAN_KEYWORDS = ["무배당", "다이렉트", "해약환급금", "보험", "형", "보장"]
+# 특약/담보명에서 흔히 보이는 키워드
+CONTRACT_KEYWORDS = ["특약", "특별약관", "진단비", "실손", "위로금", "입원의료비"]
+
+# 보험사명 + 키워드를 하나의 Aho-Corasick 오토마톤으로 묶어
+# 긴 LLM 출력도 한 번의 스캔으로 전 패턴 매칭 (미설치 시 기존 substring 스캔)
+try:
+    import ahocorasick
+
+    _automaton = ahocorasick.Automaton()
+    for _name in INSURER_NAMES:
+        _automaton.add_word(_name, ("insurer", _name))
+    for _kw in PLAN_KEYWORDS:
+        _automaton.add_word(_kw, ("plan", _kw))
+    for _kw in CONTRACT_KEYWORDS:
+        _automaton.add_word(_kw, ("contract", _kw))
+    _automaton.make_automaton()
+except Exception:
+    _automaton = None
+
+
+def _first_match_in_category(text: str, category: str) -> str:
+    for _, (cat, word) in _automaton.iter(text):
+        if cat == category:
+            return word
+    return ""
+
+
 def extract_insurer_name(text: Optional[str]) -> str:
     if not text:
         return ""
+    if _automaton is not None:
+        return _first_match_in_category(text, "insurer")
     for name in INSURER_NAMES:
         if name in text:
             return name
@@ -95,74 +325,301 @@ def extract_insurer_name(text: Optional[str]) -> str:
 def looks_like_plan_name(s: str) -> bool:
     if not s:
         return False
-    # 보험상품명(플랜명)에서 흔히 보이는 키워드
-    return any(k in s for k in ["무배당", "다이렉트", "해약환급금", "보험", "형", "보장"]) or len(s) >= 15
+    if _automaton is not None:
+        return bool(_first_match_in_category(s, "plan")) or len(s) >= 15
+    return any(k in s for k in PLAN_KEYWORDS) or len(s) >= 15
 
 
 def looks_like_contract_name(s: str) -> bool:
     if not s:
         return False
-    # 특약/담보명에서 흔히 보이는 키워드
-    return any(k in s for k in ["특약", "특별약관", "진단비", "실손", "위로금", "입원의료비"])
+    if _automaton is not None:
+        return bool(_first_match_in_category(s, "contract"))
+    return any(k in s for k in CONTRACT_KEYWORDS)
+
+
+def _tune_index(index):
+    """인덱스 타입별 검색 파라미터 적용."""
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = 64
+    elif hasattr(index, "nprobe"):
+        index.nprobe = 8
+
+
+class BatchedSearcher:
+    """동시 요청의 FAISS 검색을 마이크로배치로 묶어 한 번에 수행.
+
+    여러 워커 스레드가 동시에 검색하면 10ms 창 / 최대 32건까지 모아
+    임베딩과 index.search를 각각 1회 호출로 상환한다. 단독 요청은
+    창 만료 즉시 기존 단건 경로(LRU 캐시 포함)로 처리된다.
+    """
+
+    MAX_BATCH = 32
+    WINDOW_SEC = 0.01
+
+    def __init__(self, recommender: "InsuranceRecommender"):
+        self._recommender = recommender
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def search(self, query: str, k: int) -> List:
+        self._ensure_worker()
+        fut = Future()
+        self._queue.put((query, k, fut))
+        return fut.result()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._loop, name="faiss-batch-search", daemon=True
+                    )
+                    self._thread.start()
+
+    def _drain_batch(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.WINDOW_SEC
+        while len(batch) < self.MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._drain_batch()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                print(f"❌ 배치 검색 실패: {e}")
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_result([])
+
+    def _run_batch(self, batch: List):
+        queries = [q for q, _, _ in batch]
+        if len(batch) == 1:
+            mat = _embed_query_cached(EMBEDDING_MODEL_NAME, queries[0]).reshape(1, -1)
+        else:
+            # 다건은 한 번의 encode forward로 배치 임베딩
+            mat = np.asarray(get_embeddings().embed_documents(queries), dtype=np.float32)
+
+        vs = self._recommender.vectorstore
+        _tune_index(vs.index)
+        k_max = max(k for _, k, _ in batch)
+        scores, ids = vs.index.search(mat, k_max)
+
+        for row, (_, k, fut) in zip(ids, batch):
+            fut.set_result(self._recommender._docs_from_ids(row[:k]))
 
 
 class InsuranceRecommender:
     def __init__(self):
-        self.vectorstore = vectorstore
-        self.embeddings = embeddings
-        if RAG_AVAILABLE:
-            self._load_insurance_data()
+        # 벡터스토어/임베딩은 첫 요청 시 lazy 로드 (워커 기동 비용 절감)
+        self.vectorstore = None
+        self._ready = False
+        # faiss id 순서와 정렬된 UTF-8 본문 사이드카 (새로 빌드할 때만 채워짐)
+        self._content_bytes: Optional[List[bytes]] = None
+        # 동시 검색 마이크로배칭
+        self._searcher = BatchedSearcher(self)
+        # faiss id → Document 직접 조회 테이블 (docstore 경유 생략)
+        self._docs_by_id = None
+        # lazy 초기화 직렬화용 (동시 cold start 시 로드 완료까지 대기)
+        self._ready_lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return get_embeddings() if RAG_AVAILABLE else None
+
+    def _ensure_vectorstore(self):
+        """첫 호출 시 저장된 인덱스를 로드하고, 없으면 JSON 데이터로 새로 생성.
+
+        double-checked lock: 동시에 들어온 요청들은 먼저 진입한 스레드의
+        로드/빌드가 끝날 때까지 대기한다 (빈 결과로 fallback 방지).
+        """
+        if not self._ready and RAG_AVAILABLE:
+            with self._ready_lock:
+                if not self._ready:
+                    self.vectorstore = get_vectorstore()
+                    if not self.vectorstore or self.vectorstore.index.ntotal == 0:
+                        self._load_insurance_data()
+                    if self.vectorstore is not None:
+                        self._build_docs_by_id()
+                    # 로드/빌드 완료 후에만 완료 플래그 세팅
+                    self._ready = True
+        return self.vectorstore
+
+    def _build_docs_by_id(self):
+        """faiss id → Document 객체 배열을 한 번만 구성.
+
+        검색마다 docstore.search()를 거치는 대신 배열 인덱싱 1회로
+        문서를 찾는다.
+        """
+        try:
+            vs = self.vectorstore
+            arr = np.empty(vs.index.ntotal, dtype=object)
+            for i, doc_id in vs.index_to_docstore_id.items():
+                if i < len(arr):
+                    arr[i] = vs.docstore.search(doc_id)
+            self._docs_by_id = arr
+        except Exception as e:
+            print(f"⚠️ 문서 조회 테이블 구성 실패: {e}")
+            self._docs_by_id = None
 
     def _load_insurance_data(self):
         """절대 경로를 사용하여 모든 JSON 데이터를 FAISS에 로드"""
+        global _vectorstore
         try:
             # 이미 로드되었다면 스킵
             if self.vectorstore and self.vectorstore.index.ntotal > 0:
                 return
 
-            documents = []
-            data_dir = os.path.join(CURRENT_DIR, "..", "json", "Llama_json")
-
-            if not os.path.exists(data_dir):
-                print(f"❌ 데이터 디렉토리 없음: {data_dir}")
-                return
-
-            json_files = [f for f in os.listdir(data_dir) if f.endswith(".json")]
-            print(f"📂 {len(json_files)}개 파일 분석 중...")
-
-            for filename in json_files:
-                filepath = os.path.join(data_dir, filename)
-                with open(filepath, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    items = data if isinstance(data, list) else [data]
-                    for item in items:
-                        content = item.get("content", "").strip()
-                        if content and len(content) > 20:
-                            doc = Document(
-                                page_content=content,
-                                metadata={**item.get("metadata", {}), "source_file": filename},
-                            )
-                            documents.append(doc)
-
-            if documents:
-                self.vectorstore = FAISS.from_documents(documents, self.embeddings)
-                os.makedirs(faiss_path, exist_ok=True)
-                self.vectorstore.save_local(faiss_path)
-                print(f"✅ FAISS 생성 완료: {len(documents)}개 문서")
+            # uvicorn --workers N: 워커들이 동시에 빌드에 진입하지 않도록 직렬화
+            with _build_lock():
+                # 락 대기 중 다른 워커가 빌드를 끝냈다면 결과만 로드
+                if os.path.exists(os.path.join(faiss_path, "index.faiss")):
+                    self.vectorstore = FAISS.load_local(
+                        faiss_path, get_embeddings(), allow_dangerous_deserialization=True
+                    )
+                    _vectorstore = self.vectorstore
+                    print(f"✅ 다른 워커가 생성한 FAISS 로드됨: {self.vectorstore.index.ntotal}개 문서")
+                    return
+                self._build_from_json_files()
         except Exception as e:
             print(f"❌ 데이터 로드 치명적 오류: {e}")
 
+    def _build_from_json_files(self):
+        """json/Llama_json 아래 약관 JSON으로 FAISS 인덱스를 새로 생성."""
+        global _vectorstore
+        documents = []
+        data_dir = os.path.join(CURRENT_DIR, "..", "json", "Llama_json")
+
+        if not os.path.exists(data_dir):
+            print(f"❌ 데이터 디렉토리 없음: {data_dir}")
+            return
+
+        json_files = [f for f in os.listdir(data_dir) if f.endswith(".json")]
+        print(f"📂 {len(json_files)}개 파일 분석 중...")
+
+        for filename in json_files:
+            filepath = os.path.join(data_dir, filename)
+            with open(filepath, "rb") as f:
+                data = orjson.loads(f.read())
+                items = data if isinstance(data, list) else [data]
+                for item in items:
+                    content = item.get("content", "").strip()
+                    if content and len(content) > 20:
+                        doc = Document(
+                            page_content=content,
+                            metadata={**item.get("metadata", {}), "source_file": filename},
+                        )
+                        documents.append(doc)
+
+        if documents:
+            self.vectorstore = self._build_vectorstore(documents)
+            os.makedirs(faiss_path, exist_ok=True)
+            self.vectorstore.save_local(faiss_path)
+            _vectorstore = self.vectorstore
+            print(f"✅ FAISS 생성 완료: {len(documents)}개 문서")
+
+    EMBED_BATCH_SIZE = 64
+
+    def _embed_documents_batched(self, texts: List[str]):
+        """문서를 64개 단위 배치로 임베딩.
+
+        누적 버퍼는 float16으로 유지해 메모리를 절반으로 줄이고,
+        FAISS에 넣기 직전에만 float32로 캐스팅한다.
+        """
+        try:
+            import torch
+            inference_ctx = torch.inference_mode
+        except Exception:
+            import contextlib
+            inference_ctx = contextlib.nullcontext
+        batches = []
+        with inference_ctx():
+            for i in range(0, len(texts), self.EMBED_BATCH_SIZE):
+                vecs = self.embeddings.embed_documents(texts[i:i + self.EMBED_BATCH_SIZE])
+                batches.append(np.asarray(vecs, dtype=np.float16))
+        return np.concatenate(batches)
+
+    def _build_vectorstore(self, documents: List["Document"]):
+        """배치 임베딩 결과를 HNSW 인덱스로 구성 (브루트포스 대비 sublinear 검색)."""
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+
+        texts = [d.page_content for d in documents]
+        emb = self._embed_documents_batched(texts).astype(np.float32)
+        index = self._build_index(emb)
+
+        # 컨텍스트 생성 시 바이트 윈도로 자를 수 있도록 본문을 UTF-8로 한 번만 인코딩
+        self._content_bytes = [t.encode("utf-8") for t in texts]
+        for i, d in enumerate(documents):
+            d.metadata["_faiss_id"] = i
+
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore({str(i): d for i, d in enumerate(documents)}),
+            index_to_docstore_id={i: str(i) for i in range(len(documents))},
+        )
+
+    # IVFPQ 학습에 필요한 최소 문서 수 (nlist=64 기준 표본 확보)
+    IVFPQ_MIN_DOCS = 2560
+
+    def _build_index(self, emb):
+        """코퍼스 크기에 맞는 FAISS 인덱스 선택.
+
+        문서가 충분하면 int8 PQ 양자화(IVFPQ)로 벡터 메모리를 ~4배
+        줄이고 SIMD 친화 스캔을 쓰며, 소규모 코퍼스는 학습 표본이
+        부족하므로 HNSW를 유지한다.
+        """
+        d = emb.shape[1]
+        if len(emb) >= self.IVFPQ_MIN_DOCS:
+            quantizer = faiss.IndexFlatL2(d)
+            index = faiss.IndexIVFPQ(quantizer, d, 64, 16, 8)
+            index.train(emb)
+            index.add(emb)
+            index.nprobe = 8
+        else:
+            index = faiss.IndexHNSWFlat(d, 32)
+            index.hnsw.efConstruction = 200
+            index.add(emb)
+        return index
+
     def search_relevant_documents(self, query: str, n_results: int = 10):
+        self._ensure_vectorstore()
         if not self.vectorstore:
             print("⚠️ 검색 불가: 벡터스토어가 비어있음")
             return []
         try:
-            docs_with_scores = self.vectorstore.similarity_search_with_score(query, k=n_results)
-            return [doc for doc, score in docs_with_scores]
+            # 동시 요청은 마이크로배치로 합산되어 index.search 1회로 처리됨
+            return self._searcher.search(query, n_results)
         except Exception as e:
             print(f"❌ FAISS 검색 실패: {e}")
             return []
 
+    def _docs_from_ids(self, indices) -> List:
+        """FAISS id 배열을 문서 리스트로 변환 (배열 인덱싱 우선)."""
+        by_id = self._docs_by_id
+        docs = []
+        for idx in indices:
+            if idx == -1:
+                continue
+            if by_id is not None:
+                doc = by_id[int(idx)]
+            else:
+                doc_id = self.vectorstore.index_to_docstore_id[int(idx)]
+                doc = self.vectorstore.docstore.search(doc_id)
+            if doc is not None:
+                docs.append(doc)
+        return docs
+
     def generate_rag_recommendation(self, user_profile: Dict[str, Any], health_status: Dict[str, Any]) -> Dict[str, Any]:
         try:
             # 1. 사용자 분석
@@ -176,17 +633,26 @@ class InsuranceRecommender:
                 print("⚠️ 검색된 문서 없음 -> Fallback 실행")
                 return self._fallback_recommendation(user_profile, health_status)
 
-            # 3. LLM 질문 생성 및 호출
+            # 3. LLM 질문 생성 및 호출 (시맨틱 캐시 우선)
             context = self._build_context_from_documents(relevant_docs)
             llm_question = self._build_llm_question(analysis, context)
 
-            print(f"🤖 LLM 요청 중... (주수: {analysis['gestational_week']}주)")
-            rag_result = ask_question(llm_question, profile=analysis)
+            cached_answer = _llm_cache.get(analysis, search_query)
+            if cached_answer is not None:
+                print(f"⚡ LLM 시맨틱 캐시 적중 (주수: {analysis['gestational_week']}주)")
+                rag_result = {"answer": cached_answer}
+            else:
+                print(f"🤖 LLM 요청 중... (주수: {analysis['gestational_week']}주)")
+                rag_result = ask_question(llm_question, profile=analysis)
 
             if rag_result and "answer" in rag_result:
                 result = self._parse_llm_response_to_recommendation(rag_result["answer"], analysis, relevant_docs)
                 if not result.get("items"):
                     return self._fallback_recommendation(user_profile, health_status)
+                # 파싱까지 성공한 새 응답만 캐시
+                # (깨진 응답이 TTL 내내 재사용되어 빈 추천으로 굳는 것 방지)
+                if cached_answer is None:
+                    _llm_cache.put(analysis, search_query, rag_result["answer"])
                 return result
 
             return self._fallback_recommendation(user_profile, health_status)
@@ -195,25 +661,38 @@ class InsuranceRecommender:
             return self._fallback_recommendation(user_profile, health_status)
 
     def _build_rag_query(self, analysis: Dict[str, Any]) -> str:
-        parts = ["임신 보험", "태아 보장"]
         week = analysis.get("gestational_week", 0)
-        if week > 0:
-            parts.append(f"{week}주")
-        if analysis.get("is_multiple_pregnancy"):
-            parts.append("다태아 쌍둥이")
-        if analysis.get("risk_factors"):
-            parts.extend(analysis.get("risk_factors")[:2])
-        return " ".join(parts)
+        multi = bool(analysis.get("is_multiple_pregnancy"))
+        base = _BASE_QUERIES.get((week, multi))
+        if base is None:  # 표 범위(0-42주) 밖 값 방어
+            base = "임신 보험 태아 보장" + f" {week}주" + (" 다태아 쌍둥이" if multi else "")
+        risk_factors = analysis.get("risk_factors")
+        if risk_factors:
+            return base + " " + " ".join(risk_factors[:2])
+        return base
+
+    # 한글 800자 근사치(UTF-8 한글 3바이트) — 컨텍스트 바이트 윈도 폭
+    CONTEXT_SNIPPET_BYTES = 2400
+
+    def _doc_snippet(self, doc) -> str:
+        """본문 앞부분 발췌. 빌드 시 만든 UTF-8 사이드카가 있으면 바이트 윈도만
+        잘라 한 번 디코딩하고, 디스크에서 로드한 구버전 인덱스는 str 슬라이스."""
+        fid = (doc.metadata or {}).get("_faiss_id")
+        if self._content_bytes is not None and fid is not None and fid < len(self._content_bytes):
+            return self._content_bytes[fid][: self.CONTEXT_SNIPPET_BYTES].decode("utf-8", "ignore")
+        return doc.page_content[:800]
 
     def _build_context_from_documents(self, documents) -> str:
-        parts = []
-        for i, doc in enumerate(documents[:8]):  # 8개로 제한
-            md = doc.metadata or {}
-            parts.append(
-                f"[문서 {i+1}] 상품:{md.get('product_name','?')}, 페이지:{md.get('page_number','?')}\n"
-                f"내용:{doc.page_content[:800]}"
+        # 제너레이터 → join 1회로 중간 리스트/문자열 할당 제거 (8개로 제한)
+        return "\n\n".join(
+            _CONTEXT_TPL.format(
+                i=i + 1,
+                p=(doc.metadata or {}).get("product_name", "?"),
+                pg=(doc.metadata or {}).get("page_number", "?"),
+                c=self._doc_snippet(doc),
             )
-        return "\n\n".join(parts)
+            for i, doc in enumerate(documents[:8])
+        )
 
     # ✅ 프롬프트(출력 스키마) 스펙대로 수정함
     def _build_llm_question(self, analysis: Dict[str, Any], context: str) -> str:
@@ -250,16 +729,21 @@ class InsuranceRecommender:
 
     def _parse_llm_response_to_recommendation(self, llm_response: str, analysis: Dict[str, Any], relevant_docs) -> Dict[str, Any]:
         try:
-            json_block = re.search(r"(\{.*\})", llm_response, re.DOTALL)
+            json_block = _JSON_BLOCK.search(llm_response)
             if not json_block:
                 return {"items": []}
 
-            data = json.loads(self._fix_json_string(json_block.group(1)))
+            data = orjson.loads(self._fix_json_string(json_block.group(0)))
             recs = data.get("recommendations", [])
 
+            # 루프 불변값 호이스팅
+            n_docs = len(relevant_docs)
+            fallback_doc = relevant_docs[0]
+            gw = analysis["gestational_week"]
+
             items = []
             for idx, rec in enumerate(recs[:3]):
-                doc = relevant_docs[idx] if idx < len(relevant_docs) else relevant_docs[0]
+                doc = relevant_docs[idx] if idx < n_docs else fallback_doc
                 md = doc.metadata or {}
 
                 # ✅ 스펙 키로 파싱
@@ -274,46 +758,49 @@ class InsuranceRecommender:
                     comp = extract_insurer_name(plan_name) or comp  # 최악의 경우 원본 유지
                     prod = plan_name
 
-                # 가입금액 및 보험료 테이블 매칭(보험사+상품명 기준)
-                sum_insured = self._get_sum_insured(comp, prod)
-                monthly_cost = self._get_insurance_price(comp, prod)
+                # 가입금액 및 보험료 테이블 매칭(보험사+상품명 기준, 조회 1회)
+                sum_insured, monthly_cost = self._get_price_entry(comp, prod)
 
                 special_contracts = rec.get("special_contracts", []) or []
                 # 혹시 LLM이 special_contracts를 문자열로 줄 수도 있어서 방어
                 if isinstance(special_contracts, str):
                     special_contracts = [special_contracts]
 
+                page_number = int(md.get("page_number", 1))
+                # 빈 리스트면 내부 comprehension을 아예 타지 않음
+                special_contracts_out = [
+                    {
+                        "contract_name": str(c),
+                        "contract_description": "약관 기반 맞춤 보장",
+                        "contract_recommendation_reason": f"{gw}주차 맞춤 특약",
+                        "key_features": ["보장 범위 확인 완료"],
+                        "page_number": page_number,
+                    } for c in special_contracts
+                ] if special_contracts else []
+
                 items.append({
-                    "itemId": uuid.uuid4().hex[:8],
+                    "itemId": uuid4().hex[:8],
                     "insurance_company": comp,
                     "product_name": prod,
                     "is_long_term": True,
                     "sum_insured": int(sum_insured),
                     "monthly_cost": str(monthly_cost),
                     "insurance_recommendation_reason": rec.get("reason", ""),
-                    "special_contracts": [
-                        {
-                            "contract_name": str(c),
-                            "contract_description": "약관 기반 맞춤 보장",
-                            "contract_recommendation_reason": f"{analysis['gestational_week']}주차 맞춤 특약",
-                            "key_features": ["보장 범위 확인 완료"],
-                            "page_number": int(md.get("page_number", 1))
-                        } for c in special_contracts
-                    ],
+                    "special_contracts": special_contracts_out,
                     "evidence_sources": [
                         {
-                            "page_number": int(md.get("page_number", 1)),
+                            "page_number": page_number,
                             "text_snippet": rec.get("evidence", "")
                         }
                     ],
                 })
 
             return {
-                "resultId": uuid.uuid4().hex[:8],
+                "resultId": uuid4().hex[:8],
                 "items": items,
                 "rag_metadata": {
-                    "documents_used": len(relevant_docs),
-                    "gestational_week": analysis["gestational_week"],
+                    "documents_used": n_docs,
+                    "gestational_week": gw,
                 },
             }
         except Exception as e:
@@ -321,14 +808,12 @@ class InsuranceRecommender:
             return {"items": []}
 
     def _fix_json_string(self, s: str) -> str:
-        s = s.replace("「", "'").replace("」", "'").replace("“", "'").replace("”", "'")
-        return s.replace("True", "true").replace("False", "false").replace("None", "null")
-
-    def _get_sum_insured(self, c, p):
-        return SUM_INSURED_MAP.get(c, {}).get(p, 10000000)
+        # translate 1회 + 컴파일된 sub 1회로 중간 문자열 할당 최소화
+        s = s.translate(_QUOTE_TABLE)
+        return _PY_LITERAL_RE.sub(lambda m: _PY_LITERALS[m.group()], s)
 
-    def _get_insurance_price(self, c, p):
-        return PRICE_MAP.get(c, {}).get(p, 30000)
+    def _get_price_entry(self, c, p):
+        return COMBINED_MAP.get((c, p), DEFAULT_PRICE_ENTRY)
 
     def _fallback_recommendation(self, up, hs):
         return {"resultId": "fallback", "items": [], "rag_metadata": {"fallback": True}}
@@ -338,26 +823,20 @@ class InsuranceRecommender:
 
         p_info = user_profile.get("pregnancyInfo") or user_profile
 
-        gest_week = p_info.get("gestationalWeek") or p_info.get("gestational_week") or 0
-        is_multiple = p_info.get("isMultiplePregnancy") or p_info.get("is_multiple_pregnancy") or False
-        miscarriage = p_info.get("miscarriageHistory") or p_info.get("miscarriage_history") or 0
-
-        analysis = {
-            "gestational_week": int(gest_week),
-            "is_multiple_pregnancy": bool(is_multiple),
-            "miscarriage_history": int(miscarriage),
-            "risk_factors": [],
-        }
-
         comps = health_status.get("pregnancyComplications") or health_status.get("pregnancy_complications") or []
-        for c in comps:
-            c_type = c if isinstance(c, str) else (c.get("pregnancyComplicationType") or c.get("complication_type"))
-            if c_type == "PREECLAMPSIA":
-                analysis["risk_factors"].append("임신중독증")
-            elif c_type == "PRETERM_RISK":
-                analysis["risk_factors"].append("조산위험")
-
-        return analysis
+        risk_factors = [
+            COMPLICATION_MAP[t]
+            for c in comps
+            if (t := c if isinstance(c, str) else (c.get("pregnancyComplicationType") or c.get("complication_type")))
+            in COMPLICATION_MAP
+        ]
+
+        return {
+            "gestational_week": int(p_info.get("gestationalWeek") or p_info.get("gestational_week") or 0),
+            "is_multiple_pregnancy": bool(p_info.get("isMultiplePregnancy") or p_info.get("is_multiple_pregnancy") or False),
+            "miscarriage_history": int(p_info.get("miscarriageHistory") or p_info.get("miscarriage_history") or 0),
+            "risk_factors": risk_factors,
+        }
 
 
 recommender = InsuranceRecommender()
@@ -1,22 +1,58 @@
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel, Field, field_validator
 from typing import Dict, Any, Optional, List, Union
+import asyncio
 import os
 import uuid
+from functools import singledispatch
 from datetime import datetime, date
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 import logging
 import httpx
-from insurance_recommender import recommender
+import orjson
+from insurance_recommender import recommender, embedding_cache_info
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("bw-ai")
 
-app = FastAPI(title="BWLOVERS AI", version="1.0.0")
+
+# --- orjson 기반 응답 클래스 (직렬화 속도 개선) ---
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+
+
+app = FastAPI(title="BWLOVERS AI", version="1.0.0", default_response_class=ORJSONResponse)
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8080")
 
+# 백엔드 콜백용 공유 HTTP 클라이언트
+# (호출마다 TCP 핸드셰이크 대신 keep-alive 커넥션 풀 재사용)
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=10.0,
+)
+
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await http_client.aclose()
+
+
+async def post_backend(path: str, payload: Dict[str, Any]):
+    """백엔드 콜백 POST. 이벤트 루프를 막는 동기 requests 대신 공유 풀 사용."""
+    return await http_client.post(f"{BACKEND_URL}{path}", json=payload)
+
+
+# 추천 엔진(CPU-bound) 동시 실행 상한 — 스레드 폭증 방지
+recommend_semaphore = asyncio.Semaphore(int(os.getenv("RECOMMEND_CONCURRENCY", "4")))
+
 # --- 에러 핸들러 ---
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -24,22 +60,33 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     log.error("[422] url=%s errors=%s body=%s", request.url, exc.errors(), body.decode("utf-8", "ignore"))
     return JSONResponse(status_code=422, content={"detail": exc.errors()})
 
-# --- 날짜 변환 유틸리티 ---
+# --- 날짜 변환 유틸리티 (singledispatch로 타입 분기를 등록 시점에 고정) ---
+@singledispatch
 def any_to_date(v):
-    if v is None or isinstance(v, date):
-        return v
-    if isinstance(v, int):
-        s = str(v)
-        return date(int(s[0:4]), int(s[4:6]), int(s[6:8]))
-    if isinstance(v, list) and len(v) == 3:
+    # None, date 등 등록되지 않은 타입은 그대로 반환
+    return v
+
+@any_to_date.register
+def _(v: int):
+    # 20250901 형태: str 변환 + 슬라이스 3회 대신 divmod 2회
+    y, rest = divmod(v, 10000)
+    m, d = divmod(rest, 100)
+    return date(y, m, d)
+
+@any_to_date.register
+def _(v: list):
+    if len(v) == 3:
         return date(int(v[0]), int(v[1]), int(v[2]))
-    if isinstance(v, str):
-        try:
-            return date.fromisoformat(v.split('T')[0])
-        except:
-            return None
     return v
 
+@any_to_date.register
+def _(v: str):
+    try:
+        # 'T' 분리 할당 없이 ISO 날짜부 10자만 바로 파싱
+        return date.fromisoformat(v[:10])
+    except ValueError:
+        return None
+
 # --- 요청 스키마 (Java DTO와 1:1 매칭) ---
 class UserProfileIn(BaseModel):
     """Java의 PregnancyInfoRequest 구조"""
@@ -115,6 +162,10 @@ class RecommendListResponseOut(BaseModel):
 async def root():
     return {"message": "BWLOVERS AI 서버 실행 중", "status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    return {"embedding_cache": embedding_cache_info()}
+
 @app.post("/ai/recommend")
 async def recommend(request: BackendRequest):
     try:
@@ -125,16 +176,22 @@ async def recommend(request: BackendRequest):
         log.info(f"[요청 수신] user_id={u_prof.userId}, 주수={u_prof.gestationalWeek}")
         
         # 2. 추천 엔진용 Dictionary 변환 (필드명 보정)
-        # 추천 엔진 내부의 _analyze_user_profile이 기대하는 키값들을 명시적으로 세팅
-        user_profile_dict = u_prof.model_dump()
-        user_profile_dict['gestational_week'] = u_prof.gestationalWeek
-        user_profile_dict['is_multiple_pregnancy'] = u_prof.isMultiplePregnancy
-        user_profile_dict['miscarriage_history'] = u_prof.miscarriageHistory
-        
+        # _analyze_user_profile이 실제로 읽는 키만 직접 구성
+        # (전체 model_dump 후 덮어쓰기보다 할당이 적음)
+        user_profile_dict = {
+            'gestational_week': u_prof.gestationalWeek,
+            'is_multiple_pregnancy': u_prof.isMultiplePregnancy,
+            'miscarriage_history': u_prof.miscarriageHistory,
+        }
+
         health_status_dict = h_stat.model_dump()
         
         # 3. RAG 추천 엔진 호출
-        recommendation_result = recommender.generate_rag_recommendation(user_profile_dict, health_status_dict)
+        # 동기 인코더 + LLM 호출이 이벤트 루프를 막지 않도록 스레드로 오프로드
+        async with recommend_semaphore:
+            recommendation_result = await asyncio.to_thread(
+                recommender.generate_rag_recommendation, user_profile_dict, health_status_dict
+            )
         
         # 4. 결과 처리 (Fallback 여부 확인 및 ID 정리)
         items = recommendation_result.get("items", [])
@@ -146,18 +203,21 @@ async def recommend(request: BackendRequest):
             meta = recommendation_result["rag_metadata"]
             log.info(f"[RAG 결과] 문서수={meta.get('documents_used', 0)}, 주수={meta.get('gestational_week', 0)}")
         
-        return RecommendListResponseOut(
+        response = RecommendListResponseOut(
             resultId=clean_id,
             expiresInSec=600,
             items=items
         )
-        
+        # jsonable_encoder 재인코딩 경로를 건너뛰고 orjson으로 바로 직렬화
+        return ORJSONResponse(response.model_dump())
+
     except Exception as e:
         log.error(f"[메인 오류] 추천 프로세스 실패: {e}", exc_info=True)
-        return RecommendListResponseOut(
+        response = RecommendListResponseOut(
             resultId=f"err-{uuid.uuid4().hex[:8]}",
             items=[]
         )
+        return ORJSONResponse(response.model_dump())
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,12 @@
 import os
+import threading
 import time
+from functools import lru_cache
 from typing import Optional, Dict, Any
 
+# torch/faiss import 전에 설정해야 uvicorn 워커 간 스레드 과점유를 막음
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
@@ -19,34 +24,66 @@ if not OPENAI_API_KEY:
 os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
 # =========================
-# 2. FAISS Vectorstore 로드
+# 2. FAISS Vectorstore 로드 (lazy 싱글톤)
 # =========================
 
 DB_DIR = os.getenv("FAISS_DB_DIR", "../faiss_index")
+EMBEDDING_MODEL_NAME = "jhgan/ko-sroberta-multitask"
+
 
-if not os.path.exists(DB_DIR):
-    print(f"FAISS DB 폴더({DB_DIR})가 없습니다. 새로운 DB를 생성합니다.")
-
-# 임베딩 모델 설정
-embedding_model = HuggingFaceEmbeddings(
-    model_name="jhgan/ko-sroberta-multitask",
-    model_kwargs={"device": "cpu"},
-    encode_kwargs={"normalize_embeddings": True},
-)
-
-# FAISS DB 불러오기 
-try:
-    vectorstore = FAISS.load_local(
-        DB_DIR, 
-        embeddings=embedding_model, 
-        allow_dangerous_deserialization=True
+@lru_cache(maxsize=1)
+def get_embeddings() -> HuggingFaceEmbeddings:
+    """임베딩 모델 싱글톤. 워커/모듈마다 재로딩하지 않도록 첫 호출 시 한 번만 생성."""
+    try:
+        import torch
+        torch.set_num_threads(1)  # 워커 다중 실행 시 스레드 과점유 방지
+    except Exception:
+        pass
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True},
     )
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    print(f"FAISS DB 로드됨: {DB_DIR}")
-except Exception as e:
-    print(f"FAISS DB 로드 실패 ({e})")
-    vectorstore = None
-    retriever = None
+
+
+_vectorstore = None
+_retriever = None
+_vectorstore_loaded = False
+_vectorstore_lock = threading.Lock()
+
+
+def get_vectorstore():
+    """FAISS DB 싱글톤. import 시점이 아닌 첫 질의 시점에 로드.
+
+    double-checked lock으로 동시 cold start 스레드가 로드 완료 전에
+    retriever 없이(None) 진행하지 않도록 대기시킨다.
+    """
+    global _vectorstore, _retriever, _vectorstore_loaded
+    if not _vectorstore_loaded:
+        with _vectorstore_lock:
+            if _vectorstore_loaded:
+                return _vectorstore
+            try:
+                _vectorstore = FAISS.load_local(
+                    DB_DIR,
+                    embeddings=get_embeddings(),
+                    allow_dangerous_deserialization=True,
+                )
+                _retriever = _vectorstore.as_retriever(search_kwargs={"k": 5})
+                print(f"FAISS DB 로드됨: {DB_DIR}")
+            except Exception as e:
+                print(f"FAISS DB 로드 실패 ({e})")
+                _vectorstore = None
+                _retriever = None
+            # 로드 시도가 끝난 뒤에만 완료 플래그 세팅
+            _vectorstore_loaded = True
+    return _vectorstore
+
+
+def get_retriever():
+    get_vectorstore()
+    return _retriever
+
 
 # LLM 설정
 llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0)
@@ -61,8 +98,9 @@ def ask_question(query: str, profile: Optional[Dict[str, Any]] = None) -> Option
     """
     try:
         start_time = time.time()
-        
+
         # 1. 관련 문서 검색
+        retriever = get_retriever()
         if retriever:
             docs = retriever.invoke(query)
             context_docs = len(docs)
@@ -169,10 +207,10 @@ def check_rag_system():
     """RAG 시스템 상태 확인"""
     checks = {
         "openai_api": bool(OPENAI_API_KEY),
-        "faiss_db": os.path.exists(DB_DIR) and vectorstore is not None,
+        "faiss_db": os.path.exists(DB_DIR) and get_vectorstore() is not None,
         "embedding_model": True,
         "llm_model": True,
-        "retriever": retriever is not None
+        "retriever": get_retriever() is not None
     }
     
     print("RAG 시스템 상태 체크:")